@@ -1,7 +1,9 @@
+from datetime import datetime, timedelta
+import io
+from lxml import etree as ET
 import pandas as pd
 import re
 import streamlit as st
-import xml.etree.ElementTree as ET
 
 
 CATEGORY_LABELS = {
@@ -14,8 +16,21 @@ CATEGORY_LABELS = {
 }
 
 
-DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}$")
-TIME_PATTERN = re.compile(r"\d{2}:\d{2}$")
+# QUAL.xml tags in Clark notation.
+QUAL_NS = "{http://www.ad-opt.com/2009/Altitude/data}"
+EMPLOYEE_TAG = QUAL_NS + "employee"
+EMPLOYEE_ID_TAG = QUAL_NS + "employee-id"
+SEAT_TAG = QUAL_NS + "primary-seat-qual"
+NAME_TAG = QUAL_NS + "name"
+BASE_TAG = QUAL_NS + "base"
+AIRCRAFT_PATH = ".//" + QUAL_NS + "aircraft"
+
+
+# A whole-token YYYY-MM-DD date, optionally followed by a whole-token HH:MM
+# time, matched against the space-joined tail of an ACTS line.
+DATE_TIME_PATTERN = re.compile(
+    r"(?<!\S)(\d{4}-\d{2}-\d{2})(?!\S)(?:\s+(\d{2}:\d{2})(?!\S))?"
+)
 
 
 def parse_acts_line(line):
@@ -39,31 +54,21 @@ def parse_acts_line(line):
     if code not in ["A", "D"]:
         return None
 
-    date_indices = [i for i, token in enumerate(parts[7:], start=7) if DATE_PATTERN.match(token)]
-    if not date_indices:
+    # Start and optional end (date, time) pairs from token 7 onward.
+    matches = DATE_TIME_PATTERN.findall(" ".join(parts[7:]))
+    if not matches:
         return []
 
-    start_idx = date_indices[0]
-    start_date = pd.to_datetime(parts[start_idx], errors="coerce")
-    start_time = (
-        parts[start_idx + 1]
-        if start_idx + 1 < len(parts) and TIME_PATTERN.match(parts[start_idx + 1])
-        else None
-    )
-
-    if len(date_indices) > 1:
-        end_idx = date_indices[1]
-        end_date = pd.to_datetime(parts[end_idx], errors="coerce")
-        end_time = (
-            parts[end_idx + 1]
-            if end_idx + 1 < len(parts) and TIME_PATTERN.match(parts[end_idx + 1])
-            else None
-        )
-    else:
-        end_date = start_date
-        end_time = None
-
-    if pd.isna(start_date) or pd.isna(end_date):
+    # An unparseable date yields no entries.
+    try:
+        start_date = datetime.strptime(matches[0][0], "%Y-%m-%d").date()
+        if len(matches) > 1:
+            end_date = datetime.strptime(matches[1][0], "%Y-%m-%d").date()
+            end_time = matches[1][1] or None
+        else:
+            end_date = start_date
+            end_time = None
+    except ValueError:
         return []
 
     if end_date < start_date:
@@ -72,16 +77,21 @@ def parse_acts_line(line):
     # Some off-duty spans end in the early hours of the following day (e.g.,
     # 07:00–06:59). Those should count only for the start date, not the next day.
     if (
-        end_date == start_date + pd.Timedelta(days=1)
+        end_date == start_date + timedelta(days=1)
         and end_time is not None
         and end_time <= "06:59"
     ):
         end_date = start_date
 
-    dates = pd.date_range(start=start_date, end=end_date, freq="D")
+    span_days = (end_date - start_date).days
     return [
-        {"employee_id": emp_id, "date": single.date(), "duty": code, "base": base}
-        for single in dates
+        {
+            "employee_id": emp_id,
+            "date": start_date + timedelta(days=offset),
+            "duty": code,
+            "base": base,
+        }
+        for offset in range(span_days + 1)
     ]
 
 
@@ -103,6 +113,16 @@ def categorise_aircraft(raw_aircraft):
     return None
 
 
+def categorise_aircraft_column(aircraft):
+    """Apply ``categorise_aircraft`` once per distinct raw aircraft code."""
+
+    aircraft = aircraft.astype("category")
+    families = {raw: categorise_aircraft(raw) for raw in aircraft.cat.categories}
+    # A one-to-one mapping would come back as a Categorical ordered by the raw
+    # codes; return plain values so any later categorical is sorted by family.
+    return aircraft.map(families).astype(object)
+
+
 def initials_from_name(name):
     """Return uppercase initials from a full name string.
 
@@ -122,91 +142,101 @@ def initials_from_name(name):
 def build_daily_summary(merged_df, duty_code):
     """Return a wide dataframe of crew counts per day for a duty code (A or D)."""
 
-    filtered = merged_df[
-        (merged_df["duty"] == duty_code)
+    mask = (
+        merged_df["duty"].eq(duty_code)
         & merged_df["aircraft_family"].notna()
         & merged_df["seat"].isin(["PIC", "SIC"])
-    ].copy()
+    )
 
-    if filtered.empty:
+    if not mask.any():
         return pd.DataFrame(columns=["Date", *CATEGORY_LABELS.values()])
 
-    filtered["category"] = filtered.apply(
-        lambda row: CATEGORY_LABELS.get((row["aircraft_family"], row["seat"])), axis=1
-    )
-    filtered = filtered.dropna(subset=["category"])
+    category = pd.MultiIndex.from_arrays(
+        [merged_df.loc[mask, "aircraft_family"], merged_df.loc[mask, "seat"]]
+    ).map(CATEGORY_LABELS)
 
+    # Rows without a category have a missing group key and groupby drops them.
     counts = (
-        filtered.groupby(["date", "category"], as_index=False)["employee_id"].nunique()
+        merged_df.loc[mask, "employee_id"]
+        .groupby([merged_df.loc[mask, "date"], category], sort=False, observed=True)
+        .nunique()
+        .unstack(fill_value=0)
+        .reindex(columns=list(CATEGORY_LABELS.values()), fill_value=0)
+        .sort_index()
     )
+    summary = counts.rename_axis("Date").reset_index()
+    summary["Date"] = summary["Date"].dt.date
+    return summary
 
-    pivoted = counts.pivot_table(
-        index="date",
-        columns="category",
-        values="employee_id",
-        fill_value=0,
-    ).reset_index()
 
-    for col in CATEGORY_LABELS.values():
-        if col not in pivoted.columns:
-            pivoted[col] = 0
+def csv_bytes(df):
+    """Return ``df`` as UTF-8 encoded CSV bytes for a download button."""
 
-    ordered_columns = ["date", *CATEGORY_LABELS.values()]
-    pivoted = pivoted[ordered_columns].sort_values("date")
-    pivoted = pivoted.rename(columns={"date": "Date"})
-    return pivoted
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, encoding="utf-8")
+    return buffer.getvalue()
 
-st.set_page_config(page_title="Crew Availability Overview", layout="wide")
-st.title("🧭 Crew Availability Overview")
 
-st.write(
-    "Upload QUAL.xml and an ACTS file to see how many PICs and SICs are on A and D days, "
-    "broken down by Embraer, CJ3, and CJ2 fleets."
-)
+@st.cache_data
+def parse_qual(file_bytes):
+    """Parse QUAL.xml contents into one row per employee."""
 
-# -------------------------------
-# File uploaders
-# -------------------------------
-qual_file = st.file_uploader("Upload QUAL.xml", type=["xml"])
-acts_file = st.file_uploader("Upload ACTS file")
+    emp_ids, seats, names, bases, aircrafts = [], [], [], [], []
+    root = None
+    for _, emp in ET.iterparse(io.BytesIO(file_bytes), tag=EMPLOYEE_TAG):
+        # Only direct children of the root count, as with root.findall().
+        # Once the root is known a single identity check is enough.
+        parent = emp.getparent()
+        if parent is None:
+            continue
+        if parent is not root:
+            if parent.getparent() is not None:
+                continue
+            root = parent
+        emp_ids.append(emp.findtext(EMPLOYEE_ID_TAG))
+        seats.append(emp.findtext(SEAT_TAG))
+        names.append(emp.findtext(NAME_TAG))
+        base_elem = emp.find(BASE_TAG)
+        bases.append(base_elem.get("ref") if base_elem is not None else None)
+        ac_elem = emp.find(AIRCRAFT_PATH)
+        aircrafts.append(ac_elem.get("ref") if ac_elem is not None else None)
+
+        # Clear the employee and detach it (and any earlier siblings) from the
+        # root, so the partially built tree never grows with the file.
+        emp.clear()
+        while emp.getprevious() is not None:
+            del root[0]
+
+    # Seat and aircraft only hold a handful of distinct values, so store them
+    # as categoricals; base stays plain until it is combined with ACTS bases.
+    df_qual = pd.DataFrame({
+        "employee_id": emp_ids,
+        "seat": pd.Categorical(seats),
+        "name": names,
+        "base": bases,
+        "aircraft": pd.Categorical(aircrafts),
+    })
+
+    # Resolve display initials once per pilot, falling back to the employee ID
+    # when the name has no usable letters.
+    df_qual["initials"] = (
+        df_qual["name"].map(initials_from_name).fillna(df_qual["employee_id"])
+    )
+    return df_qual
 
-if qual_file and acts_file:
-    # -------------------------------
-    # Parse QUAL.XML
-    # -------------------------------
-    ns = {"ns": "http://www.ad-opt.com/2009/Altitude/data"}
-    tree = ET.parse(qual_file)
-    root = tree.getroot()
-
-    pilots = []
-    for emp in root.findall("ns:employee", ns):
-        emp_id = emp.findtext("ns:employee-id", namespaces=ns)
-        seat = emp.findtext("ns:primary-seat-qual", namespaces=ns)
-        name = emp.findtext("ns:name", namespaces=ns)
-        base_elem = emp.find("ns:base", ns)
-        base = base_elem.get("ref") if base_elem is not None else None
-        ac_elem = emp.find(".//ns:aircraft", ns)
-        aircraft = ac_elem.get("ref") if ac_elem is not None else None
-        pilots.append({
-            "employee_id": emp_id,
-            "seat": seat,
-            "name": name,
-            "base": base,
-            "aircraft": aircraft,
-        })
 
-    df_qual = pd.DataFrame(
-        pilots,
-        columns=["employee_id", "seat", "name", "base", "aircraft"],
-    )
+@st.cache_data
+def parse_acts(file_bytes):
+    """Parse ACTS file contents into one row per employee, date and duty.
+
+    Returns the duty dataframe together with the number of entries skipped
+    because their dates could not be recognized.
+    """
 
-    # -------------------------------
-    # Parse ACTS file
-    # -------------------------------
     acts_data = []
     invalid_date_lines = 0
-    text = acts_file.read().decode("utf-8")
-    for line in text.splitlines():
+    # Universal newlines, so bare-\r line endings still split correctly.
+    for line in io.TextIOWrapper(io.BytesIO(file_bytes), encoding="utf-8"):
         entries = parse_acts_line(line)
         if entries is None:
             continue
@@ -220,31 +250,35 @@ if qual_file and acts_file:
         columns=["employee_id", "date", "duty", "base"],
     )
 
-    df_acts["date"] = pd.to_datetime(df_acts["date"], errors="coerce").dt.date
+    # strptime accepts years outside the datetime64[ns] range; coerce those to
+    # NaT and count them as skipped.
+    df_acts["date"] = pd.to_datetime(df_acts["date"], errors="coerce")
     invalid_dates = df_acts["date"].isna().sum()
-    if invalid_dates or invalid_date_lines:
-        skipped = invalid_dates + invalid_date_lines
-        st.warning(
-            f"{skipped} duty entries had unrecognized dates and were skipped."
-        )
     df_acts = df_acts.dropna(subset=["date"])
 
-    if df_acts.empty:
-        st.warning(
-            "No usable ACTS duty records were found. Please verify the file format and availability codes (A or D)."
-        )
+    # Overlapping ACTS lines can repeat the same duty entry for a pilot on one
+    # day; drop those up front so the merge and every later step see it once.
+    df_acts = df_acts.drop_duplicates(ignore_index=True)
+    for col in ["duty", "base"]:
+        df_acts[col] = df_acts[col].astype("category")
+    return df_acts, int(invalid_dates + invalid_date_lines)
 
-    if df_qual.empty:
-        st.warning(
-            "No pilot qualification data was parsed from QUAL.xml. Please ensure the file is valid."
-        )
 
+@st.cache_data
+def build_merged(qual_bytes, acts_bytes):
+    """Join ACTS duty entries with pilot qualifications and aircraft families.
+
+    Returns the merged dataframe, the number of parsed pilots and the number of
+    skipped ACTS entries. If either upload yields no rows, the unmerged ACTS
+    frame is returned. Keyed on the upload bytes because Streamlit hashes only
+    a sample of rows of large DataFrames.
+    """
+
+    df_qual = parse_qual(qual_bytes)
+    df_acts, skipped = parse_acts(acts_bytes)
     if df_acts.empty or df_qual.empty:
-        st.stop()
+        return df_acts, len(df_qual), skipped
 
-    # -------------------------------
-    # Merge and process
-    # -------------------------------
     merged = df_acts.merge(
         df_qual,
         on="employee_id",
@@ -252,13 +286,62 @@ if qual_file and acts_file:
         suffixes=("_acts", "_qual"),
     )
 
-    merged["base"] = merged["base_qual"].combine_first(merged["base_acts"])
+    # Fill before casting: ACTS base codes may be absent from QUAL's categories.
+    merged["base"] = (
+        merged["base_qual"].fillna(merged["base_acts"]).astype("category")
+    )
     merged = merged.drop(columns=["base_acts", "base_qual"])
 
-    merged["aircraft_family"] = merged["aircraft"].apply(categorise_aircraft)
+    merged["aircraft_family"] = (
+        categorise_aircraft_column(merged["aircraft"]).astype("category")
+    )
+    # ACTS entries for pilots missing from QUAL.xml have no initials yet.
+    merged["initials"] = merged["initials"].fillna(merged["employee_id"])
+    return merged, len(df_qual), skipped
+
+
+st.set_page_config(page_title="Crew Availability Overview", layout="wide")
+st.title("🧭 Crew Availability Overview")
+
+st.write(
+    "Upload QUAL.xml and an ACTS file to see how many PICs and SICs are on A and D days, "
+    "broken down by Embraer, CJ3, and CJ2 fleets."
+)
+
+# -------------------------------
+# File uploaders
+# -------------------------------
+qual_file = st.file_uploader("Upload QUAL.xml", type=["xml"])
+acts_file = st.file_uploader("Upload ACTS file")
+
+if qual_file and acts_file:
+    # -------------------------------
+    # Parse, merge and process (cached on file contents across reruns)
+    # -------------------------------
+    merged, n_pilots, skipped = build_merged(
+        qual_file.getvalue(), acts_file.getvalue()
+    )
 
-    min_date = merged["date"].min()
-    max_date = merged["date"].max()
+    if skipped:
+        st.warning(
+            f"{skipped} duty entries had unrecognized dates and were skipped."
+        )
+
+    if merged.empty:
+        st.warning(
+            "No usable ACTS duty records were found. Please verify the file format and availability codes (A or D)."
+        )
+
+    if not n_pilots:
+        st.warning(
+            "No pilot qualification data was parsed from QUAL.xml. Please ensure the file is valid."
+        )
+
+    if merged.empty or not n_pilots:
+        st.stop()
+
+    min_date = merged["date"].min().date()
+    max_date = merged["date"].max().date()
 
     st.write("### Date range")
     selected_range = st.date_input(
@@ -274,7 +357,9 @@ if qual_file and acts_file:
 
     start_date, end_date = selected_range
 
-    filtered = merged[(merged["date"] >= start_date) & (merged["date"] <= end_date)]
+    filtered = merged[
+        merged["date"].between(pd.Timestamp(start_date), pd.Timestamp(end_date))
+    ]
     if filtered.empty:
         st.warning("No duty entries fall within the selected date range.")
         st.stop()
@@ -283,7 +368,7 @@ if qual_file and acts_file:
     d_days = build_daily_summary(filtered, "D")
 
     st.success(
-        f"Parsed {len(df_qual)} pilots and {len(filtered)} duty entries within the selected range."
+        f"Parsed {n_pilots} pilots and {len(filtered)} duty entries within the selected range."
     )
 
     st.write("### Counts on A days")
@@ -293,10 +378,10 @@ if qual_file and acts_file:
     st.dataframe(d_days, use_container_width=True)
 
     st.download_button(
-        "Download A day summary (CSV)", a_days.to_csv(index=False).encode("utf-8"), "a_days.csv", "text/csv"
+        "Download A day summary (CSV)", csv_bytes(a_days), "a_days.csv", "text/csv"
     )
     st.download_button(
-        "Download D day summary (CSV)", d_days.to_csv(index=False).encode("utf-8"), "d_days.csv", "text/csv"
+        "Download D day summary (CSV)", csv_bytes(d_days), "d_days.csv", "text/csv"
     )
 
     # -------------------------------
@@ -311,14 +396,11 @@ if qual_file and acts_file:
         key="debug_date",
     )
 
-    day_slice = merged[merged["date"] == debug_date].copy()
+    day_slice = merged[merged["date"] == pd.Timestamp(debug_date)]
 
     if day_slice.empty:
         st.info("No duty entries found on the selected date.")
     else:
-        day_slice["initials"] = day_slice["name"].apply(initials_from_name)
-        day_slice["initials"] = day_slice["initials"].fillna(day_slice["employee_id"])
-
         columns = [
             "duty",
             "aircraft_family",